@@ -3,36 +3,119 @@ Dashboard Web para Monitoramento de Umidade do Solo
 Sistema IoT - Irrigação Automática
 """
 
-from datetime import datetime
+from array import array
+import atexit
 from collections import deque
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import socket
 import threading
+import time
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, request
+import orjson
 import paho.mqtt.client as mqtt
 
 import config as app_config
 
 app = Flask(__name__)
 
+# =========================
+# Logs
+# =========================
+
+# Os callbacks MQTT só enfileiram o registro (QueueHandler); a escrita no
+# terminal acontece na thread do QueueListener, fora do loop do Paho.
+# Mensagens por mensagem MQTT são DEBUG e ficam desligadas no nível padrão.
+log = logging.getLogger("dashboard")
+log.setLevel(getattr(app_config, "LOG_LEVEL", "INFO"))
+log.propagate = False
+
+_log_queue = queue.Queue(-1)
+log.addHandler(QueueHandler(_log_queue))
+
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_stream)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 # =========================
 # Estado em memória
 # =========================
 
 HISTORY_SIZE = getattr(app_config, "MAX_HISTORY_SIZE", 100)
 
+
+class Ring:
+    """
+    Buffer circular de tamanho fixo sobre um array tipado.
+    Cada amostra ocupa só o tamanho do tipo (sem um objeto Python por valor).
+    """
+
+    def __init__(self, typecode, size):
+        self.buf = array(typecode, [0]) * size
+        self.size = size
+        self.head = 0
+        self.count = 0
+
+    def append(self, value):
+        self.buf[self.head] = value
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def snapshot(self):
+        """Retorna as amostras em ordem cronológica (da mais antiga à mais nova)."""
+        if self.count < self.size:
+            return self.buf[:self.count]
+        return self.buf[self.head:] + self.buf[:self.head]
+
+
+# Umidade do solo em int16 (0–100) e timestamps em epoch-ms (int64)
 data_history = {
-    "soil_moisture": deque(maxlen=HISTORY_SIZE),
-    "timestamps": deque(maxlen=HISTORY_SIZE),
+    "soil_moisture": Ring("h", HISTORY_SIZE),
+    "timestamps": Ring("q", HISTORY_SIZE),
 }
 
-current_data = {
-    "soil_moisture": 0,
-    "relay_status": "OFF",
-    "status": "offline",
-    "last_update": None,
-}
+# Estado atual publicado como snapshot imutável num slot de lista.
+# Só _flush() escreve (serializado por _flush_lock): monta um dict novo e troca
+# _snapshot[0] (atribuição atômica sob a GIL); as rotas Flask apenas leem,
+# sem lock.
+_snapshot = [
+    {
+        "soil_moisture": 0,
+        "relay_status": "OFF",
+        "status": "offline",
+        "last_update": None,   # epoch em ms; formatado pelo navegador
+    }
+]
+
+# Versões incrementadas pelo escritor sempre que o estado muda.
+# _history_version funciona como seqlock: fica ímpar enquanto um append
+# está em andamento, e o leitor repete a cópia se ela mudar no meio.
+# As rotas /api/data e /api/history só re-serializam o JSON quando a
+# versão em cache fica desatualizada; nos demais polls devolvem os bytes prontos.
+_data_version = 0
+_history_version = 0
+
+# (versão, bytes JSON) — trocados juntos numa única atribuição
+_data_cache = (-1, b"")
+_history_cache = (-1, b"")
 
-data_lock = threading.Lock()
+# Identifica esta execução do processo nos ETags de /api/data e /api/history
+_ETAG_PREFIX = f"{time.time_ns():x}"
+
+# Mensagens recebidas e ainda não aplicadas ao estado:
+# (handler de HANDLERS ou None, tópico, payload, ts_ns).
+# São aplicadas em lote por _flush() ao atingir MQTT_BATCH_SIZE ou após
+# MQTT_BATCH_WINDOW_MS, o que ocorrer primeiro.
+BATCH_SIZE = getattr(app_config, "MQTT_BATCH_SIZE", 16)
+BATCH_WINDOW_S = getattr(app_config, "MQTT_BATCH_WINDOW_MS", 50) / 1000
+
+_pending = deque()
+_flush_lock = threading.Lock()
+_flush_timer = None
 
 # =========================
 # MQTT – configurações
@@ -41,24 +124,56 @@ data_lock = threading.Lock()
 MQTT_BROKER = getattr(app_config, "MQTT_BROKER", "localhost")
 MQTT_PORT = getattr(app_config, "MQTT_PORT", 1883)
 
-DEFAULT_MQTT_TOPICS = [
-    getattr(app_config, "MQTT_TOPIC_SOIL_MOISTURE", "sensor/soil_moisture"),
-    getattr(app_config, "MQTT_TOPIC_RELAY_STATUS", "actuator/relay_status"),
-    getattr(app_config, "MQTT_TOPIC_STATUS", "sensor/status"),
-]
+# Tópicos resolvidos uma única vez; usados tanto na assinatura quanto na
+# tabela HANDLERS e na publicação de comandos.
+TOPIC_SOIL_MOISTURE = getattr(app_config, "MQTT_TOPIC_SOIL_MOISTURE", "sensor/soil_moisture")
+TOPIC_RELAY_STATUS = getattr(app_config, "MQTT_TOPIC_RELAY_STATUS", "actuator/relay_status")
+TOPIC_STATUS = getattr(app_config, "MQTT_TOPIC_STATUS", "sensor/status")
+TOPIC_RELAY_CONTROL = getattr(app_config, "MQTT_TOPIC_RELAY_CONTROL", "actuator/relay_control")
+
+# QoS/retain dos comandos do relé (ver config.py)
+RELAY_CONTROL_QOS = getattr(app_config, "MQTT_RELAY_CONTROL_QOS", 1)
+RELAY_CONTROL_RETAIN = getattr(app_config, "MQTT_RELAY_CONTROL_RETAIN", False)
+
+# Comandos aceitos → payload já em bytes (validação e encode numa busca só)
+RELAY_COMMANDS = {"ON": b"ON", "OFF": b"OFF", "AUTO": b"AUTO"}
+
+DEFAULT_MQTT_TOPICS = [TOPIC_SOIL_MOISTURE, TOPIC_RELAY_STATUS, TOPIC_STATUS]
 
 MQTT_TOPICS = getattr(app_config, "MQTT_TOPICS", DEFAULT_MQTT_TOPICS)
 
-mqtt_client = mqtt.Client()      # assina tópicos (dados vindo da ESP32)
-mqtt_publisher = mqtt.Client()   # publica comandos (atuador/relay_control)
+SOCKET_BUFFER_SIZE = getattr(app_config, "MQTT_SOCKET_BUFFER_SIZE", 262144)
+
+# Um único cliente assina os tópicos (dados vindo da ESP32) e publica os
+# comandos (actuator/relay_control); publish() é thread-safe no Paho.
+mqtt_client = mqtt.Client()
 
 # =========================
 # Callbacks MQTT
 # =========================
 
+def _tune_socket(client):
+    """
+    Buffers TCP maiores para absorver a rajada de mensagens retidas após o
+    subscribe, e TCP_NODELAY para o PUBACK/comando não esperar o Nagle.
+    """
+    sock = client.socket()
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if hasattr(socket, "TCP_QUICKACK"):   # só existe no Linux
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    except OSError as exc:
+        log.warning("⚠️ Não foi possível ajustar o socket MQTT: %s", exc)
+
+
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print("✅ Conectado ao broker MQTT")
+        _tune_socket(client)
         for topic in MQTT_TOPICS:
             client.subscribe(topic)
             print(f"📡 Inscrito no tópico: {topic}")
@@ -66,59 +181,222 @@ def on_connect(client, userdata, flags, rc):
         print(f"❌ Falha na conexão MQTT. Código: {rc}")
 
 
-def on_message(client, userdata, msg):
-    topic = msg.topic
-    payload = msg.payload.decode("utf-8", errors="ignore")
-    timestamp = datetime.now()
+def on_connect_fail(client, userdata):
+    # Chamado pelo loop do Paho a cada tentativa (inicial ou de reconexão)
+    # que falha ao abrir o socket; depois disso ele aguarda o backoff.
+    log.warning(
+        "❌ Erro ao conectar ao broker MQTT %s:%s, tentando novamente",
+        MQTT_BROKER, MQTT_PORT,
+    )
+
+
+def on_disconnect(client, userdata, rc):
+    if rc != 0:
+        log.warning(
+            "🔌 Conexão com o broker MQTT perdida (%s), reconectando",
+            mqtt.error_string(rc),
+        )
+
 
+def _parse_percent(payload):
+    """Leitura em % (0–100); limita ao intervalo para caber no ring int16."""
     try:
-        with data_lock:
-            # Umidade do solo (vindo da ESP em 0–100)
-            if topic == app_config.MQTT_TOPIC_SOIL_MOISTURE:
-                try:
-                    value = int(payload)
-                except ValueError:
-                    value = 0
-                current_data["soil_moisture"] = value
-                data_history["soil_moisture"].append(value)
-                data_history["timestamps"].append(timestamp.isoformat())
+        value = int(payload)   # int() aceita bytes direto, sem decode
+    except ValueError:
+        return 0
+    return min(max(value, 0), 100)
 
-            # Status do relé (ON/OFF/AUTO)
-            elif topic == app_config.MQTT_TOPIC_RELAY_STATUS:
-                current_data["relay_status"] = payload.upper()
 
-            # Status geral da ESP32 (online/offline)
-            elif topic == app_config.MQTT_TOPIC_STATUS:
-                current_data["status"] = payload.lower()
+def _parse_upper(payload):
+    return payload.decode("utf-8", errors="ignore").upper()
 
-            # Sempre que chega algo reconhecido, atualiza last_update
-            current_data["last_update"] = timestamp.strftime("%Y-%m-%d %H:%M:%S")
 
-        print(f"📨 [{topic}] {payload}")
+def _parse_lower(payload):
+    return payload.decode("utf-8", errors="ignore").lower()
 
-    except Exception as exc:
-        print(f"⚠️ Erro ao processar mensagem MQTT: {exc}")
+
+# Tabela de despacho: tópico → (campo no snapshot, parser do payload,
+# chave do histórico ou None). Cada entrada vira um callback próprio no Paho.
+HANDLERS = {
+    # Umidade do solo (vindo da ESP em 0–100)
+    TOPIC_SOIL_MOISTURE: ("soil_moisture", _parse_percent, "soil_moisture"),
+    # Status do relé (ON/OFF/AUTO)
+    TOPIC_RELAY_STATUS: ("relay_status", _parse_upper, None),
+    # Status geral da ESP32 (online/offline)
+    TOPIC_STATUS: ("status", _parse_lower, None),
+}
+
+
+def _flush():
+    """
+    Aplica todas as mensagens pendentes com uma única troca de snapshot.
+    Nunca propaga exceções: roda no loop do Paho ou na thread do Timer.
+    """
+    global _flush_timer
+
+    with _flush_lock:
+        _flush_timer = None
+        try:
+            _apply_pending()
+        except Exception as exc:
+            log.warning("⚠️ Erro ao aplicar lote de mensagens MQTT: %s", exc)
+
+
+def _apply_pending():
+    """Corpo de _flush(); chamado com _flush_lock adquirido."""
+    global _data_version, _history_version
+
+    if not _pending:
+        return
+
+    fields = {}
+    samples = []
+
+    # Métodos resolvidos uma vez por lote, fora do laço
+    popleft = _pending.popleft
+    add_sample = samples.append
+
+    for _ in range(len(_pending)):
+        handler, topic, payload, ts_ns = popleft()
+        ts_ms = ts_ns // 1_000_000
+        try:
+            if handler is not None:
+                field, parse, history_key = handler
+                value = parse(payload)
+                fields[field] = value
+                if history_key is not None:
+                    add_sample((history_key, value, ts_ms))
+            else:
+                value = payload.decode("utf-8", errors="ignore")
+
+            # Sempre que chega algo, atualiza last_update
+            fields["last_update"] = ts_ms
+
+            log.debug("📨 [%s] %s", topic, value)
+
+        except Exception as exc:
+            log.warning("⚠️ Erro ao processar mensagem MQTT: %s", exc)
+
+    if fields:
+        _snapshot[0] = {**_snapshot[0], **fields}
+        _data_version += 1
+
+    if samples:
+        append_ts = data_history["timestamps"].append
+        _history_version += 1
+        try:
+            for history_key, value, ts_ms in samples:
+                data_history[history_key].append(value)
+                append_ts(ts_ms)
+        finally:
+            # Seqlock sempre volta a par, senão get_history() ficaria em loop
+            _history_version += 1
+
+
+def _arm_flush_timer():
+    """Agenda um flush para mensagens que não completaram um lote."""
+    global _flush_timer
+
+    with _flush_lock:
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(BATCH_WINDOW_S, _flush)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+
+def _enqueue(handler, msg):
+    _pending.append((handler, msg.topic, msg.payload, time.time_ns()))
+
+    if len(_pending) >= BATCH_SIZE:
+        _flush()
+    else:
+        _arm_flush_timer()
+
+
+def on_topic_message(handler):
+    """
+    Cria o callback de um tópico, com o handler já vinculado, para
+    message_callback_add: o Paho roteia sem passar por on_message.
+    É uma função de verdade (com __name__), que o Paho usa ao logar erros.
+    """
+    def on_topic(client, userdata, msg):
+        _enqueue(handler, msg)
+
+    return on_topic
+
+
+def on_message(client, userdata, msg):
+    # Só recebe tópicos sem handler dedicado (ex.: extras em MQTT_TOPICS)
+    _enqueue(None, msg)
+
+
+def on_publish(client, userdata, mid):
+    # PUBACK do broker (QoS 1) ou envio ao socket (QoS 0): a rota HTTP não espera
+    log.debug("✅ Comando confirmado pelo broker (mid=%s)", mid)
 
 # =========================
 # Inicialização MQTT
 # =========================
 
 mqtt_client.on_connect = on_connect
+mqtt_client.on_connect_fail = on_connect_fail
+mqtt_client.on_disconnect = on_disconnect
 mqtt_client.on_message = on_message
+# Callbacks dedicados só para tópicos efetivamente assinados
+for topic, handler in HANDLERS.items():
+    if topic in MQTT_TOPICS:
+        mqtt_client.message_callback_add(topic, on_topic_message(handler))
+mqtt_client.on_publish = on_publish
+
+# Reconexão com backoff exponencial e filas limitadas: durante uma queda do
+# broker os comandos não crescem sem limite na memória.
+mqtt_client.reconnect_delay_set(
+    min_delay=getattr(app_config, "MQTT_RECONNECT_MIN_DELAY", 1),
+    max_delay=getattr(app_config, "MQTT_RECONNECT_MAX_DELAY", 60),
+)
+mqtt_client.max_inflight_messages_set(getattr(app_config, "MQTT_MAX_INFLIGHT", 20))
+mqtt_client.max_queued_messages_set(getattr(app_config, "MQTT_MAX_QUEUED", 1000))
 
 try:
-    mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    # connect_async: se o broker ainda não estiver no ar, o loop do Paho
+    # continua tentando (com o backoff acima) em vez de desistir na partida.
+    # Não abre o socket aqui: falhas de conexão chegam em on_connect_fail.
+    mqtt_client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
     mqtt_client.loop_start()
-
-    mqtt_publisher.connect(MQTT_BROKER, MQTT_PORT, 60)
-    mqtt_publisher.loop_start()
-except Exception as exc:
-    print(f"❌ Erro ao conectar ao broker MQTT: {exc}")
+except ValueError as exc:
+    # Só configuração inválida (host vazio, porta ou keepalive negativos)
+    log.error("❌ Configuração MQTT inválida: %s", exc)
 
 # =========================
 # Rotas Flask
 # =========================
 
+def _json(obj, status=200):
+    """Equivalente ao jsonify, serializando com orjson."""
+    return Response(orjson.dumps(obj), status=status, mimetype="application/json")
+
+
+def _etag(kind, version):
+    # O prefixo por processo evita 304 indevido depois de reiniciar o
+    # dashboard, quando as versões voltam a contar do zero.
+    return f'"{_ETAG_PREFIX}-{kind}{version:x}"'
+
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _cached_json(body, etag):
+    """Resposta JSON com ETag; no-cache força revalidação, mas permite 304."""
+    response = Response(body, mimetype="application/json")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -126,19 +404,52 @@ def index():
 
 @app.route("/api/data")
 def get_data():
-    with data_lock:
-        return jsonify(current_data)
+    global _data_cache
+
+    # Lê a versão antes do snapshot: se o escritor avançar no meio,
+    # o cache fica marcado com a versão antiga e é refeito no próximo poll.
+    version = _data_version
+    etag = _etag("d", version)
+    if request.headers.get("If-None-Match") == etag:
+        return _not_modified(etag)
+
+    cached_version, body = _data_cache
+    if cached_version != version:
+        body = orjson.dumps(_snapshot[0])
+        _data_cache = (version, body)
+
+    return _cached_json(body, etag)
 
 
 @app.route("/api/history")
 def get_history():
-    with data_lock:
-        return jsonify(
-            {
-                "soil_moisture": list(data_history["soil_moisture"]),
-                "timestamps": list(data_history["timestamps"]),
-            }
-        )
+    global _history_cache
+
+    # Versão ímpar (append em andamento) nunca bate com um ETag já enviado
+    etag = _etag("h", _history_version)
+    if request.headers.get("If-None-Match") == etag:
+        return _not_modified(etag)
+
+    cached_version, body = _history_cache
+    if cached_version == _history_version:
+        return _cached_json(body, _etag("h", cached_version))
+
+    while True:
+        version = _history_version
+        if version & 1:
+            # append em andamento em _flush(); cede a GIL e tenta de novo
+            time.sleep(0)
+            continue
+        history = {
+            "soil_moisture": data_history["soil_moisture"].snapshot().tolist(),
+            "timestamps": data_history["timestamps"].snapshot().tolist(),
+        }
+        if version == _history_version:
+            break
+
+    body = orjson.dumps(history)
+    _history_cache = (version, body)
+    return _cached_json(body, _etag("h", version))
 
 
 @app.route("/api/relay/control", methods=["POST"])
@@ -148,20 +459,51 @@ def control_relay():
     que é o tópico que a ESP32 está assinando.
     """
     try:
-        data = request.get_json(silent=True) or {}
-        command = str(data.get("command", "")).upper()
-
-        if command not in {"ON", "OFF", "AUTO"}:
-            return jsonify(
-                {"status": "error", "message": "Comando inválido"}
-            ), 400
-
-        mqtt_publisher.publish(app_config.MQTT_TOPIC_RELAY_CONTROL, command, qos=1)
-        print(f"📤 Enviado comando para relé: {command}")
-        return jsonify({"status": "success", "command": command})
-
-    except Exception as exc:
-        return jsonify({"status": "error", "message": str(exc)}), 500
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
+        command = data.get("command")
+        if not command:
+            return _json(
+                {"status": "error", "message": "Comando ausente"}, status=400
+            )
+        command = str(command).upper()
+
+        payload = RELAY_COMMANDS.get(command)
+        if payload is None:
+            return _json(
+                {"status": "error", "message": "Comando inválido"}, status=400
+            )
+
+        # Apenas enfileira no loop do Paho; a confirmação chega em on_publish,
+        # sem bloquear a rota à espera do PUBACK (sem wait_for_publish()).
+        info = mqtt_client.publish(
+            TOPIC_RELAY_CONTROL, payload, qos=RELAY_CONTROL_QOS, retain=RELAY_CONTROL_RETAIN
+        )
+        if info.rc == mqtt.MQTT_ERR_NO_CONN and RELAY_CONTROL_QOS > 0:
+            # Com QoS > 0 o Paho guarda o comando (_out_messages) e reenvia ao
+            # reconectar: foi aceito, só não saiu ainda.
+            log.debug("📥 Comando para relé enfileirado: %s (mid=%s)", command, info.mid)
+            return _json(
+                {"status": "queued", "command": command, "mid": info.mid}, status=202
+            )
+        # Demais falhas: fila cheia, ou sem conexão com QoS 0 (descartado)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            if info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+                message = "Fila de comandos MQTT cheia"
+            elif info.rc == mqtt.MQTT_ERR_NO_CONN:
+                message = "Broker MQTT desconectado"
+            else:
+                message = mqtt.error_string(info.rc)
+            return _json({"status": "error", "message": message}, status=503)
+
+        log.debug("📤 Enviado comando para relé: %s (mid=%s)", command, info.mid)
+        return _json({"status": "success", "command": command, "mid": info.mid})
+
+    except (ValueError, OSError) as exc:
+        # Argumentos inválidos (ValueError) ou erro de socket (OSError);
+        # falhas de envio reportadas em info.rc já foram tratadas acima
+        return _json({"status": "error", "message": str(exc)}, status=500)
 
 
 if __name__ == "__main__":
@@ -20,6 +20,12 @@ MQTT_TOPIC_STATUS        = "sensor/status"
 MQTT_TOPIC_RELAY_STATUS  = "actuator/relay_status"   # status atual do relé
 MQTT_TOPIC_RELAY_CONTROL = "actuator/relay_control"  # comandos ON/OFF/AUTO
 
+# Comandos ON/OFF/AUTO são idempotentes: QoS 0 dispensa o PUBACK, QoS 1
+# garante a entrega ao broker. Retain faria a ESP32 receber o último comando
+# ao reconectar — cuidado: um "ON" retido religa a irrigação após um reboot.
+MQTT_RELAY_CONTROL_QOS = 1
+MQTT_RELAY_CONTROL_RETAIN = False
+
 # Lista de tópicos que o dashboard deve assinar
 MQTT_TOPICS = [
     MQTT_TOPIC_SOIL_MOISTURE,
@@ -27,6 +33,22 @@ MQTT_TOPICS = [
     MQTT_TOPIC_STATUS,
 ]
 
+# Lote de mensagens: o dashboard aplica as mensagens recebidas de uma vez
+# ao juntar MQTT_BATCH_SIZE delas ou após MQTT_BATCH_WINDOW_MS
+MQTT_BATCH_SIZE = 16
+MQTT_BATCH_WINDOW_MS = 50
+
+# Reconexão ao broker: espera (s) cresce de MIN até MAX entre tentativas
+MQTT_RECONNECT_MIN_DELAY = 1
+MQTT_RECONNECT_MAX_DELAY = 60
+
+# Limites de mensagens QoS>0 em voo e enfileiradas (comandos do relé)
+MQTT_MAX_INFLIGHT = 20
+MQTT_MAX_QUEUED = 1000
+
+# Tamanho (bytes) de SO_RCVBUF/SO_SNDBUF aplicado ao socket MQTT ao conectar
+MQTT_SOCKET_BUFFER_SIZE = 262144
+
 # =========================
 # Configurações do Flask
 # =========================
@@ -40,3 +62,10 @@ FLASK_DEBUG = True   # se quiser evitar reloader duplicado, pode trocar para Fal
 # =========================
 
 MAX_HISTORY_SIZE = 100
+
+# =========================
+# Logs
+# =========================
+
+# Nível de log do dashboard ("DEBUG" mostra cada mensagem MQTT e comando)
+LOG_LEVEL = "INFO"
@@ -0,0 +1,19 @@
+"""
+Configuração do Gunicorn para o dashboard IoT.
+Carregada automaticamente ao rodar o gunicorn a partir de raspberry-pi/dashboard.
+"""
+
+import config as app_config
+
+bind = f"{getattr(app_config, 'FLASK_HOST', '0.0.0.0')}:{getattr(app_config, 'FLASK_PORT', 5000)}"
+
+# Um único worker: o estado (snapshot + histórico) e o cliente MQTT vivem
+# em memória no processo. Mais workers fragmentariam esse estado entre
+# processos, cada um com sua própria conexão ao broker.
+workers = 1
+worker_class = "gthread"
+threads = 8
+
+# Os polls de /api/data e /api/history (a cada 2 s) reaproveitam a conexão TCP
+keepalive = 30
+reuse_port = True
@@ -0,0 +1,6 @@
+"""
+Ponto de entrada WSGI do dashboard (produção).
+Execute: gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+from app import app as application
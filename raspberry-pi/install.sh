@@ -47,7 +47,8 @@ echo "=========================================="
 echo ""
 echo "Para iniciar o dashboard, execute:"
 echo "  cd raspberry-pi/dashboard"
-echo "  python3 app.py"
+echo "  python3 app.py                                            # desenvolvimento"
+echo "  python3 -m gunicorn -c gunicorn.conf.py wsgi:application  # produção"
 echo ""
 echo "O dashboard estará disponível em: http://localhost:5000"
 echo ""
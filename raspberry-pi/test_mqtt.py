@@ -1,76 +1,271 @@
 #!/usr/bin/env python3
 """
 Script de teste para verificar o funcionamento do broker MQTT
-Execute: python3 test_mqtt.py
+Execute: python3 test_mqtt.py [--verbose]
+Por padrão, no terminal, mostra uma linha de status atualizada 1x/s com o
+último valor de cada tópico; --verbose imprime cada mensagem recebida.
+Cliente asyncio (opcional, requer: pip3 install "aiomqtt<2"):
+    MQTT_TEST_ASYNC=1 python3 test_mqtt.py
 """
 
 import paho.mqtt.client as mqtt
-import time
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from paho.mqtt.subscribeoptions import SubscribeOptions
+import argparse
+from collections import deque
+import json
+import os
 import sys
+import threading
 
 # Configurações
 BROKER = 'localhost'
 PORT = 1883
 TOPICS = ['sensor/temperature', 'sensor/humidity', 'sensor/status']
 
-def on_connect(client, userdata, flags, rc):
+# Pré-calculados uma vez: lista para um único SUBSCRIBE com todos os
+# tópicos, e conjunto para filtrar mensagens antes de decodificar
+_SUB_LIST = [(topic, 0) for topic in TOPICS]
+_TOPIC_SET = frozenset(TOPICS)
+
+# MQTT v5 (cliente Paho): anuncia ReceiveMaximum alto no CONNECT para o
+# broker não limitar as publicações QoS>0 em voo, e assina com noLocal
+# para nunca receber de volta o que este cliente publicar
+_RECEIVE_MAXIMUM = 65535
+_SUB_LIST_V5 = [(topic, SubscribeOptions(qos=0, noLocal=True)) for topic in TOPICS]
+
+# Caixa de entrada entre o loop do Paho e a thread que escreve no terminal:
+# o callback só empilha (tópico, payload) e sinaliza; decode e escrita
+# ficam em _drain(), liberando o loop para ler o próximo pacote
+_INBOX = deque(maxlen=65536)
+_INBOX_READY = threading.Event()
+_DRAIN_STOP = threading.Event()
+_CHUNK_SIZE = 4096
+
+# Modo resumo: guarda só o último payload de cada tópico e redesenha uma
+# linha de status por segundo (com \r, sem rolar a tela), qualquer que seja
+# a taxa de mensagens. Definido em main(); desligado por --verbose ou sem TTY.
+_summary = False
+_LAST = {topic: None for topic in TOPICS}
+_LABELS = {topic: topic.rsplit('/', 1)[-1] for topic in TOPICS}
+_STATUS_INTERVAL = 1.0
+
+# Prefixo "📨 [tópico] " já em bytes para cada tópico conhecido: a linha é
+# montada concatenando bytes, sem f-string nem decode do payload
+_PREFIX = {topic: "📨 [{}] ".format(topic).encode() for topic in TOPICS}
+
+# Fora de um terminal (pipe, journal) a saída vira NDJSON: {"t":..., "p":...}
+_TTY = sys.stdout.isatty()
+_NDJSON_PREFIX = {
+    topic: b'{"t":' + json.dumps(topic).encode() + b',"p":' for topic in TOPICS
+}
+
+# Toda a saída vai direto ao buffer binário do stdout: uma escrita (e um
+# flush) por evento, em vez do par conteúdo + "\n" do print()
+_OUT = sys.stdout.buffer.write
+_FLUSH = sys.stdout.buffer.flush
+
+# Mensagens de log (_say): no terminal, junto com as mensagens; fora dele,
+# vão para o stderr e o stdout fica só com o NDJSON
+_LOG = sys.stdout.buffer if _TTY else sys.stderr.buffer
+
+_BANNER = (
+    "=" * 50 + "\n"
+    "Teste do Broker MQTT\n"
+    + "=" * 50 + "\n"
+    f"Broker: {BROKER}:{PORT}\n\n"
+).encode()
+
+def _say(text):
+    """Escreve uma linha de log com uma única chamada de write"""
+    _LOG.write((text + "\n").encode())
+    _LOG.flush()
+
+def on_connect(client, userdata, flags, rc, properties=None):
     """Callback quando conecta ao broker"""
     if rc == 0:
-        print("✅ Conectado ao broker MQTT com sucesso!")
-        print(f"📡 Inscrito nos tópicos: {', '.join(TOPICS)}\n")
-        for topic in TOPICS:
-            client.subscribe(topic)
+        _say(
+            "✅ Conectado ao broker MQTT com sucesso!\n"
+            f"📡 Inscrito nos tópicos: {', '.join(TOPICS)}\n"
+        )
+        client.subscribe(_SUB_LIST_V5)
     else:
-        print(f"❌ Falha na conexão. Código: {rc}")
+        _say(f"❌ Falha na conexão. Código: {rc}")
         sys.exit(1)
 
+def _receive(topic, payload):
+    """Entrega uma mensagem recebida ao modo de saída ativo"""
+    if topic not in _TOPIC_SET:
+        return
+    if _summary:
+        _LAST[topic] = payload
+    else:
+        _INBOX.append((topic, payload))
+        _INBOX_READY.set()
+
 def on_message(client, userdata, msg):
     """Callback quando recebe mensagem"""
-    print(f"📨 [{msg.topic}] {msg.payload.decode('utf-8')}")
+    _receive(msg.topic, msg.payload)
+
+def _status_line():
+    fields = ' '.join(
+        f"{_LABELS[topic]}={'--' if value is None else value.decode('utf-8', 'replace')}"
+        for topic, value in _LAST.items()
+    )
+    # \x1b[K apaga o resto da linha anterior quando a nova é mais curta
+    return f"\r[{fields}]\x1b[K".encode()
+
+def _status_loop(stop):
+    """Redesenha a linha de status a cada segundo até stop ser sinalizado"""
+    last = None
+    while not stop.wait(_STATUS_INTERVAL):
+        line = _status_line()
+        if line != last:
+            _OUT(line)
+            _FLUSH()
+            last = line
 
-def on_disconnect(client, userdata, rc):
+def _write_inbox():
+    """Esvazia a caixa de entrada com uma escrita por bloco de ~4 KiB"""
+    chunk = []
+    size = 0
+    while _INBOX:
+        topic, payload = _INBOX.popleft()
+        if _TTY:
+            line = _PREFIX[topic] + payload + b"\n"
+        else:
+            line = (
+                _NDJSON_PREFIX[topic]
+                + json.dumps(payload.decode('utf-8', 'replace')).encode()
+                + b"}\n"
+            )
+        chunk.append(line)
+        size += len(line)
+        if size >= _CHUNK_SIZE:
+            _OUT(b"".join(chunk))
+            chunk = []
+            size = 0
+    if chunk:
+        _OUT(b"".join(chunk))
+    _FLUSH()
+
+def _drain():
+    """
+    Thread consumidora: dorme até o callback sinalizar novas mensagens.
+    É a única que esvazia a caixa de entrada, inclusive no encerramento.
+    """
+    while not _DRAIN_STOP.is_set():
+        _INBOX_READY.wait()
+        _INBOX_READY.clear()
+        _write_inbox()
+    _write_inbox()
+
+def on_disconnect(client, userdata, rc, properties=None):
     """Callback quando desconecta"""
-    print("\n🔌 Desconectado do broker")
+    _say("\n🔌 Desconectado do broker")
 
-def main():
-    print("=" * 50)
-    print("Teste do Broker MQTT")
-    print("=" * 50)
-    print(f"Broker: {BROKER}:{PORT}\n")
-    
+def run_paho():
+    """Cliente Paho com o loop na thread principal"""
     # Criar cliente MQTT
-    client = mqtt.Client()
+    client = mqtt.Client(protocol=mqtt.MQTTv5)
     client.on_connect = on_connect
     client.on_message = on_message
     client.on_disconnect = on_disconnect
     
+    # Conectar ao broker
+    _say("🔌 Conectando ao broker...")
+    connect_props = Properties(PacketTypes.CONNECT)
+    connect_props.ReceiveMaximum = _RECEIVE_MAXIMUM
+    client.connect(BROKER, PORT, 60, properties=connect_props)
+    
+    _say("⏳ Aguardando mensagens (pressione Ctrl+C para sair)...\n")
+    
+    # Loop na thread principal: fica bloqueado no select() até chegar
+    # tráfego ou vencer o keepalive (o próprio Paho envia os PINGREQ),
+    # sem thread extra nem acordar a cada segundo
+    try:
+        client.loop_forever(retry_first_connection=False)
+    except KeyboardInterrupt:
+        _say("\n\n🛑 Interrompendo teste...")
+        client.disconnect()
+
+async def _consume_asyncio(aiomqtt):
+    _say("🔌 Conectando ao broker (asyncio)...")
+    async with aiomqtt.Client(BROKER, port=PORT) as client:
+        _say("✅ Conectado ao broker MQTT com sucesso!")
+        async with client.messages() as messages:
+            await client.subscribe(_SUB_LIST)
+            _say(
+                f"📡 Inscrito nos tópicos: {', '.join(TOPICS)}\n\n"
+                "⏳ Aguardando mensagens (pressione Ctrl+C para sair)...\n"
+            )
+            # Vários pacotes por recv(), despachados no próprio event loop
+            async for msg in messages:
+                _receive(msg.topic.value, msg.payload)
+
+def run_asyncio():
+    """Cliente aiomqtt (asyncio), sem troca de thread por pacote"""
+    import asyncio
+    try:
+        import aiomqtt
+    except ImportError:
+        _say("❌ Erro: aiomqtt não instalado (pip3 install \"aiomqtt<2\")")
+        sys.exit(1)
+    
+    try:
+        asyncio.run(_consume_asyncio(aiomqtt))
+    except KeyboardInterrupt:
+        _say("\n\n🛑 Interrompendo teste...")
+
+def main():
+    global _summary
+    
+    parser = argparse.ArgumentParser(description="Teste do broker MQTT")
+    parser.add_argument('--verbose', action='store_true',
+                        help="imprime cada mensagem em vez da linha de status")
+    args = parser.parse_args()
+    _summary = _TTY and not args.verbose
+    
+    if _TTY:
+        _OUT(_BANNER)
+        _FLUSH()
+    else:
+        _say(f"mqtt_test start broker={BROKER}:{PORT}")
+    
+    # Só uma das threads de saída: no modo resumo a caixa de entrada fica vazia
+    stop_status = threading.Event()
+    drain = None
+    if _summary:
+        threading.Thread(target=_status_loop, args=(stop_status,), daemon=True).start()
+    else:
+        drain = threading.Thread(target=_drain, daemon=True)
+        drain.start()
+    
     try:
-        # Conectar ao broker
-        print("🔌 Conectando ao broker...")
-        client.connect(BROKER, PORT, 60)
-        
-        # Iniciar loop
-        client.loop_start()
-        
-        print("⏳ Aguardando mensagens (pressione Ctrl+C para sair)...\n")
-        
-        # Manter script rodando
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("\n\n🛑 Interrompendo teste...")
-            client.loop_stop()
-            client.disconnect()
-            print("✅ Teste finalizado")
+        if os.environ.get("MQTT_TEST_ASYNC") == "1":
+            run_asyncio()
+        else:
+            run_paho()
+        stop_status.set()
+        if _summary:
+            _OUT(_status_line() + b"\n")
+        if drain is not None:
+            # Acorda o consumidor para o último esvaziamento e espera terminar
+            _DRAIN_STOP.set()
+            _INBOX_READY.set()
+            drain.join()
+        _say("✅ Teste finalizado")
             
     except ConnectionRefusedError:
-        print("❌ Erro: Não foi possível conectar ao broker MQTT")
-        print("   Verifique se o Mosquitto está rodando:")
-        print("   sudo systemctl status mosquitto")
+        _say(
+            "❌ Erro: Não foi possível conectar ao broker MQTT\n"
+            "   Verifique se o Mosquitto está rodando:\n"
+            "   sudo systemctl status mosquitto"
+        )
         sys.exit(1)
     except Exception as e:
-        print(f"❌ Erro: {e}")
+        _say(f"❌ Erro: {e}")
         sys.exit(1)
 
 if __name__ == '__main__':